@@ -1,3 +1,5 @@
+import weakref
+
 from nmigen import *
 from nmigen.utils import log2_int
 
@@ -9,6 +11,13 @@ from ..memory import MemoryMap
 __all__ = ["WishboneCSRBridge"]
 
 
+# Bridges wrapping the same CSR bus expose identical (frozen) memory maps,
+# which are shared rather than rebuilt. Each cached map refers to the CSR
+# memory map through its window, so the id() used as a key cannot be reused
+# while the entry is alive.
+_wb_map_cache = weakref.WeakValueDictionary()
+
+
 class WishboneCSRBridge(Elaboratable):
     """Wishbone to CSR bridge.
 
@@ -32,13 +41,17 @@ class WishboneCSRBridge(Elaboratable):
         ``csr_bus.data_width``.
     name : str
         Window name. Optional.
+    features : iter(str)
+        Optional Wishbone features. See :class:`..wishbone.Interface`. With
+        ``"stall"``, the request is accepted in the cycle before it is
+        acknowledged.
 
     Attributes
     ----------
     wb_bus : :class:`..wishbone.Interface`
         Wishbone bus provided by the bridge.
     """
-    def __init__(self, csr_bus, *, data_width=None, name=None):
+    def __init__(self, csr_bus, *, data_width=None, name=None, features=frozenset()):
         if not isinstance(csr_bus, CSRInterface):
             raise ValueError("CSR bus must be an instance "
                              "of CSRInterface, not {!r}"
@@ -50,21 +63,30 @@ class WishboneCSRBridge(Elaboratable):
         if data_width is None:
             data_width = csr_bus.data_width
 
+        self._ratio      = data_width // csr_bus.data_width
+        self._ratio_log2 = log2_int(self._ratio)
+
         self.csr_bus = csr_bus
         self.wb_bus  = WishboneInterface(
-            addr_width=max(0, csr_bus.addr_width - 
-                              log2_int(data_width // csr_bus.data_width)),
+            addr_width=max(0, csr_bus.addr_width - self._ratio_log2),
             data_width=data_width,
             granularity=csr_bus.data_width,
+            features=features,
             name="wb")
-
-        wb_map = MemoryMap(addr_width=csr_bus.addr_width,
-                           data_width=csr_bus.data_width,
-                           name=name)
-        # Since granularity of the Wishbone interface matches the data width
-        # of the CSR bus, no width conversion is performed, even if the
-        # Wishbone data width is greater.
-        wb_map.add_window(self.csr_bus.memory_map)
+        self._has_stall = "stall" in self.wb_bus.layout.fields
+
+        wb_map_key = (id(csr_bus.memory_map), csr_bus.addr_width,
+                      csr_bus.data_width, name)
+        wb_map = _wb_map_cache.get(wb_map_key)
+        if wb_map is None:
+            wb_map = MemoryMap(addr_width=csr_bus.addr_width,
+                               data_width=csr_bus.data_width,
+                               name=name)
+            # Since granularity of the Wishbone interface matches the data width
+            # of the CSR bus, no width conversion is performed, even if the
+            # Wishbone data width is greater.
+            wb_map.add_window(self.csr_bus.memory_map)
+            _wb_map_cache[wb_map_key] = wb_map
         self.wb_bus.memory_map = wb_map
 
     def elaborate(self, platform):
@@ -73,53 +95,84 @@ class WishboneCSRBridge(Elaboratable):
 
         m = Module()
         comb, sync = m.d.comb, m.d.sync
-        slen = len(wb_bus.sel)
+        slen  = self._ratio
+        gran  = wb_bus.granularity
+        sel   = wb_bus.sel
+        dat_w = wb_bus.dat_w
+        dat_r = wb_bus.dat_r
 
         # cycle through at the granularity of the Wisbone Bus, updating the CSR
-        # note: cycle is up to 1 more than the wb.sel granularity.
-        # use cycle to construct the CSR bus address.
-        cycle = Signal(range(slen + 1))
-        comb += csr_bus.addr.eq(Cat(cycle[:log2_int(slen)], wb_bus.adr))
+        # note: cycle has 1 more state than the wb.sel granularity, the last
+        # one does the "ack". cycle is one-hot encoded: bit N is set while
+        # lane N is being accessed, so no decoder is needed to select a lane.
+        cycle = Signal(slen + 1, reset=1)
+        last  = cycle[slen]
 
         # when cyc/stb are first raised, cycle starts progressing.
         # however, on WB4 pipeline-mode requests we cannot rely on stb
         # being held hi indefinitely (like it is in WB3 "classic").
-        # use cycle being non-zero to continue sending CSR requests
+        # use cycle having left its first state to continue sending CSR requests
         is_in_progress = Signal()
-        comb += is_in_progress.eq(cycle != 0)
-
-        # WB 4 pipeline mode w/stall
-        if hasattr(wb_bus, "stall"):
-            comb += wb_bus.stall.eq(~ack)
-
-        with m.If(wb_bus.cyc & (wb_bus.stb | is_in_progress)):
-            # cover up to len(sel)+1 cases, last one does the "ack"
-            with m.Switch(cycle):
-                def segment(index):
-                    return slice(wb_bus.granularity * index,
-                                 wb_bus.granularity * (index + 1))
-
-                # cycle between 0..len(wb.sel)-1
-                for index, sel_index in enumerate(wb_bus.sel):
-                    prev_seg = segment(index - 1)
-                    seg = segment(index)
-                    with m.Case(index):
-                        if index > 0:
-                            # CSR reads registered: need to re-register them.
-                            sync += wb_bus.dat_r[prev_seg].eq(csr_bus.r_data)
-                        comb += csr_bus.r_stb.eq(sel_index & ~wb_bus.we)
-                        comb += csr_bus.w_data.eq(wb_bus.dat_w[seg])
-                        comb += csr_bus.w_stb.eq(sel_index & wb_bus.we)
-                        sync += cycle.eq(index + 1)
-
-                # cycle is len(wb.sel). use this to send an ack
-                with m.Default():
-                    sync += wb_bus.dat_r[seg].eq(csr_bus.r_data)
-                    sync += wb_bus.ack.eq(1)
-
-        # one clock later, clear ack and reset cycle back to zero
+        comb += is_in_progress.eq(~cycle[0])
+
+        # construct the CSR bus address. only the first lane is addressed
+        # directly from wb.adr: the address of each following lane is loaded
+        # into a register during the lane before it, which keeps the latency
+        # unchanged. the low bits select the lane.
+        addr_r    = Signal.like(csr_bus.addr)
+        addr_lane = csr_bus.addr[:self._ratio_log2]
+        with m.If(is_in_progress):
+            comb += csr_bus.addr.eq(addr_r)
+        with m.Else():
+            comb += csr_bus.addr.eq(Cat(Const(0, self._ratio_log2), wb_bus.adr))
+
+        # WB 4 pipeline mode w/stall: only accept the request once the last
+        # lane has been issued, i.e. in the cycle in which ack is registered.
+        if self._has_stall:
+            comb += wb_bus.stall.eq(wb_bus.cyc & (wb_bus.ack | ~last))
+
+        # select the write data lane by AND-ing each lane with its cycle bit
+        # and OR-ing the results together, rather than decoding a lane index.
+        w_data_fanin = 0
+        for index in range(slen):
+            w_data_fanin |= Mux(cycle[index], dat_w.word_select(index, gran), 0)
+
+        # current lane masked by wb.sel: a single reduction drives the strobes
+        # for every lane.
+        lane_sel = Signal(slen)
+        comb += lane_sel.eq(sel & cycle[:slen])
+
+        # CSR reads are registered: r_data only holds a value in the cycle
+        # after r_stb, and is only captured then.
+        r_stb_d = Signal()
+        sync += r_stb_d.eq(csr_bus.r_stb)
+
+        # one clock after the ack is registered, clear it and reset cycle back
+        # to its first state. the ack is only ever raised from the last state,
+        # so no transaction is in flight at this point.
         with m.If(wb_bus.ack):
-            sync += cycle.eq(0)
+            sync += cycle.eq(1)
             sync += wb_bus.ack.eq(0)
+        with m.Elif(wb_bus.cyc & (wb_bus.stb | is_in_progress)):
+            # cycle through lanes 0..len(wb.sel)-1
+            with m.If(~last):
+                comb += csr_bus.r_stb.eq(lane_sel.any() & ~wb_bus.we)
+                comb += csr_bus.w_data.eq(w_data_fanin)
+                comb += csr_bus.w_stb.eq(lane_sel.any() & wb_bus.we)
+                sync += cycle.eq(cycle << 1)
+                sync += addr_r.eq(Cat((addr_lane + 1)[:self._ratio_log2],
+                                      csr_bus.addr[self._ratio_log2:]))
+
+            # all lanes done. use this to send an ack
+            with m.Else():
+                sync += wb_bus.ack.eq(1)
+
+            # CSR reads registered: need to re-register them. lanes are read
+            # in ascending order, so shift each one in from the top of wb.dat_r
+            # until the first lane reaches the bottom. lanes that were not
+            # selected read as zero, and wb.dat_r is left alone during writes.
+            with m.If(is_in_progress & ~wb_bus.we):
+                sync += dat_r.eq(Cat(dat_r[gran:],
+                                     Mux(r_stb_d, csr_bus.r_data, 0)))
 
         return m
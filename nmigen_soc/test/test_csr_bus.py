@@ -1,5 +1,6 @@
 # nmigen: UnusedElaboratable=no
 
+import os
 import unittest
 from nmigen import *
 from nmigen.hdl.rec import Layout
@@ -9,6 +10,18 @@ from ..csr.bus import *
 from ..memory import MemoryMap
 
 
+def simulation_test(dut, process):
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+    sim.add_sync_process(process)
+    # Dumping waveforms dominates the run time of these tests; only do it on request.
+    if os.environ.get("NMIGEN_SOC_TEST_VCD"):
+        with sim.write_vcd(vcd_file=open("test.vcd", "w")):
+            sim.run()
+    else:
+        sim.run()
+
+
 class ElementTestCase(unittest.TestCase):
     def test_layout_1_ro(self):
         elem = Element(1, "r")
@@ -242,11 +255,7 @@ class MultiplexerTestCase(unittest.TestCase):
             self.assertEqual((yield elem_16_rw.w_stb), 1)
             self.assertEqual((yield elem_16_rw.w_data), 0xaa55)
 
-        sim = Simulator(self.dut)
-        sim.add_clock(1e-6)
-        sim.add_sync_process(sim_test)
-        with sim.write_vcd(vcd_file=open("test.vcd", "w")):
-            sim.run()
+        simulation_test(self.dut, sim_test)
 
 
 class MultiplexerAlignedTestCase(unittest.TestCase):
@@ -302,11 +311,7 @@ class MultiplexerAlignedTestCase(unittest.TestCase):
             self.assertEqual((yield elem_20_rw.w_stb), 1)
             self.assertEqual((yield elem_20_rw.w_data), 0x3aa55)
 
-        sim = Simulator(self.dut)
-        sim.add_clock(1e-6)
-        sim.add_sync_process(sim_test)
-        with sim.write_vcd(vcd_file=open("test.vcd", "w")):
-            sim.run()
+        simulation_test(self.dut, sim_test)
 
 
 class DecoderTestCase(unittest.TestCase):
@@ -379,7 +384,7 @@ class DecoderTestCase(unittest.TestCase):
             yield bus.w_data.eq(0x55)
             yield
             yield bus.w_stb.eq(0)
-            yield
+            yield Settle()
             self.assertEqual((yield elem_1.w_data), 0x55)
 
             yield bus.addr.eq(elem_2_addr)
@@ -387,7 +392,7 @@ class DecoderTestCase(unittest.TestCase):
             yield bus.w_data.eq(0xaa)
             yield
             yield bus.w_stb.eq(0)
-            yield
+            yield Settle()
             self.assertEqual((yield elem_2.w_data), 0xaa)
 
             yield elem_1.r_data.eq(0x55)
@@ -404,8 +409,4 @@ class DecoderTestCase(unittest.TestCase):
 
         m = Module()
         m.submodules += self.dut, mux_1, mux_2
-        sim = Simulator(m)
-        sim.add_clock(1e-6)
-        sim.add_sync_process(sim_test)
-        with sim.write_vcd(vcd_file=open("test.vcd", "w")):
-            sim.run()
+        simulation_test(m, sim_test)
@@ -40,6 +40,21 @@ class WishboneCSRBridgeTestCase(unittest.TestCase):
                 r"CSR bus data width must be one of 8, 16, 32, 64, not 7"):
             WishboneCSRBridge(csr_bus=csr.Interface(addr_width=10, data_width=7))
 
+    def test_wrong_csr_bus_memory_map(self):
+        with self.assertRaisesRegex(NotImplementedError,
+                r"Bus interface \(rec csr_bus addr r_data r_stb w_data w_stb\) "
+                r"does not have a memory map"):
+            WishboneCSRBridge(csr.Interface(addr_width=10, data_width=8, name="csr_bus"))
+
+    def test_memory_map_shared(self):
+        mux   = csr.Multiplexer(addr_width=10, data_width=8)
+        dut_1 = WishboneCSRBridge(mux.bus, data_width=32)
+        dut_2 = WishboneCSRBridge(mux.bus, data_width=16)
+        dut_3 = WishboneCSRBridge(mux.bus, data_width=32, name="foo")
+        self.assertIs(dut_1.wb_bus.memory_map, dut_2.wb_bus.memory_map)
+        self.assertIsNot(dut_1.wb_bus.memory_map, dut_3.wb_bus.memory_map)
+        self.assertEqual(dut_3.wb_bus.memory_map.name, "foo")
+
     def test_narrow(self):
         mux   = csr.Multiplexer(addr_width=10, data_width=8)
         reg_1 = MockRegister(8, name="reg_1")
@@ -238,3 +253,101 @@ class WishboneCSRBridgeTestCase(unittest.TestCase):
         sim.add_sync_process(sim_test)
         with sim.write_vcd(vcd_file=open("test.vcd", "w")):
             sim.run()
+
+    def test_wide_adr_change(self):
+        mux   = csr.Multiplexer(addr_width=10, data_width=8)
+        reg_0 = MockRegister(32, name="reg_0")
+        mux.add(reg_0.element)
+        reg_1 = MockRegister(32, name="reg_1")
+        mux.add(reg_1.element)
+        dut   = WishboneCSRBridge(mux.bus, data_width=32)
+
+        def sim_test():
+            yield reg_0.data.eq(0x44332211)
+            yield reg_1.data.eq(0x88776655)
+
+            yield dut.wb_bus.cyc.eq(1)
+            yield dut.wb_bus.adr.eq(0)
+            yield dut.wb_bus.sel.eq(0b1111)
+            yield dut.wb_bus.we.eq(0)
+            yield dut.wb_bus.stb.eq(1)
+            yield
+            # only the first lane is addressed from wb.adr
+            yield dut.wb_bus.stb.eq(0)
+            yield dut.wb_bus.adr.eq(1)
+            yield
+            yield
+            yield
+            yield
+            yield
+            self.assertEqual((yield dut.wb_bus.ack), 1)
+            self.assertEqual((yield dut.wb_bus.dat_r), 0x44332211)
+            yield
+            self.assertEqual((yield dut.wb_bus.ack), 0)
+            self.assertEqual((yield reg_0.r_count), 1)
+            self.assertEqual((yield reg_1.r_count), 0)
+
+        m = Module()
+        m.submodules += mux, reg_0, reg_1, dut
+        sim = Simulator(m)
+        sim.add_clock(1e-6)
+        sim.add_sync_process(sim_test)
+        with sim.write_vcd(vcd_file=open("test.vcd", "w")):
+            sim.run()
+
+    def test_wide_pipelined(self):
+        mux = csr.Multiplexer(addr_width=10, data_width=8)
+        reg = MockRegister(32, name="reg")
+        mux.add(reg.element)
+        dut = WishboneCSRBridge(mux.bus, data_width=32, features={"stall"})
+
+        def sim_test():
+            # back-to-back write and read, each presented as soon as the
+            # previous request has been accepted.
+            requests = [(1, 0x44332211), (0, 0)]
+            yield dut.wb_bus.cyc.eq(1)
+            yield dut.wb_bus.sel.eq(0b1111)
+            yield dut.wb_bus.we.eq(1)
+            yield dut.wb_bus.dat_w.eq(0x44332211)
+            yield dut.wb_bus.stb.eq(1)
+            issued = [requests.pop(0)]
+
+            trace = []
+            for _ in range(12):
+                yield Settle()
+                stb   = (yield dut.wb_bus.stb)
+                stall = (yield dut.wb_bus.stall)
+                ack   = (yield dut.wb_bus.ack)
+                trace.append((stall, ack))
+                if ack:
+                    we, _ = issued.pop(0)
+                    if not we:
+                        self.assertEqual((yield dut.wb_bus.dat_r), 0x44332211)
+                yield
+                if stb and not stall:
+                    if requests:
+                        issued.append(requests[0])
+                        we, dat_w = requests.pop(0)
+                        yield dut.wb_bus.we.eq(we)
+                        yield dut.wb_bus.dat_w.eq(dat_w)
+                    else:
+                        yield dut.wb_bus.stb.eq(0)
+
+            # stall is held while lanes are issued, dropped in the cycle the
+            # request is accepted, and raised again while it is acknowledged.
+            self.assertEqual(trace, [
+                (1, 0), (1, 0), (1, 0), (1, 0), (0, 0), (1, 1),
+                (1, 0), (1, 0), (1, 0), (1, 0), (0, 0), (1, 1),
+            ])
+            self.assertEqual(issued, [])
+            self.assertEqual((yield reg.r_count), 1)
+            self.assertEqual((yield reg.w_count), 1)
+            self.assertEqual((yield reg.data), 0x44332211)
+
+        m = Module()
+        m.submodules += mux, reg, dut
+        sim = Simulator(m)
+        sim.add_clock(1e-6)
+        sim.add_sync_process(sim_test)
+        with sim.write_vcd(vcd_file=open("test.vcd", "w")):
+            sim.run()
@@ -22,7 +22,6 @@ setup(
     description="System on Chip toolkit for nMigen",
     #long_description="""TODO""",
     license="BSD",
-    setup_requires=["wheel", "setuptools", "setuptools_scm"],
     install_requires=["nmigen>=0.0,<=0.5"],
     packages=find_packages(),
     project_urls={